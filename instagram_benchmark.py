@@ -0,0 +1,370 @@
+"""Benchmark offline do fluxo completo do Unfluencer.
+
+Roda `processar_usuario` de ponta a ponta sem rede: o Instagram é o
+MockInstagramClient, a imagem vem de um servidor HTTP local, o modelo é o
+MockInferenceClient (com latência configurável) e as perguntas do `input()`
+são respondidas por um roteiro. Tudo roda em um diretório temporário, com o
+`prompt.json` do projeto (ou um de exemplo, se ele não existir). Ao final
+mostra o tempo de cada etapa registrado pelo MetricsRegistry de
+`instagram_comment`.
+
+Com `--startup` mede apenas o tempo de import a frio de `instagram_comment`,
+comparando com o custo de carregar o SDK da OCI, o instagrapi e o cliente logo
+no import (como era antes da inicialização sob demanda). Com `--prompt` mede a
+montagem do prompt com o PromptConfig contra reler o `prompt.json` e recompilar
+a regex de emojis a cada resposta.
+
+Uso:
+    python instagram_benchmark.py --iteracoes 5 --latencia 0.5 --modo texto
+    python instagram_benchmark.py --startup --repeticoes 5
+    python instagram_benchmark.py --prompt
+"""
+import argparse
+import builtins
+import dataclasses
+import io
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# As variáveis precisam existir antes de importar instagram_comment
+os.environ['USE_MOCKS'] = 'true'
+os.environ['USE_MOCK_LLM'] = 'true'
+
+# Prompt usado quando o projeto não tem um prompt.json
+PROMPT_FIXTURE = {
+    "prompt": {
+        "instructions": [
+            "Você é o Unfluencer.",
+            "Responda com uma única frase curta que questione o comentário."
+        ],
+        "comment_template": "Comentário: {comment}"
+    }
+}
+
+
+def preparar_diretorio(diretorio: str):
+    """Grava no diretório de trabalho do benchmark o prompt.json a ser usado."""
+    destino = os.path.join(diretorio, 'prompt.json')
+    if os.path.exists('prompt.json'):
+        with open('prompt.json', 'r', encoding='utf-8') as f:
+            prompt_data = json.load(f)
+    else:
+        prompt_data = PROMPT_FIXTURE
+    with open(destino, 'w', encoding='utf-8') as f:
+        json.dump(prompt_data, f, ensure_ascii=False)
+
+
+def gerar_imagem_fixture(largura: int = 2048, altura: int = 2048) -> bytes:
+    """Gera uma imagem JPEG de teste (ou bytes aleatórios, se o Pillow não estiver instalado)."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return random.Random(42).randbytes(largura * altura // 8)
+
+    imagem = Image.effect_noise((largura, altura), 64).convert('RGB')
+    saida = io.BytesIO()
+    imagem.save(saida, format='JPEG', quality=95)
+    return saida.getvalue()
+
+
+def iniciar_servidor_imagem(image_data: bytes) -> ThreadingHTTPServer:
+    """Sobe um servidor HTTP local que responde qualquer GET com a imagem de teste."""
+
+    class ImagemHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(image_data)))
+            self.end_headers()
+            self.wfile.write(image_data)
+
+        def log_message(self, format, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), ImagemHandler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+class RoteiroInput:
+    """Substitui `input()` devolvendo as respostas do roteiro em ciclo.
+
+    `confirmacoes` conta quantas vezes o roteiro respondeu "yes", ou seja,
+    quantas respostas chegaram até a confirmação do revisor.
+    """
+
+    def __init__(self, respostas):
+        self.respostas = list(respostas)
+        self.posicao = 0
+        self.confirmacoes = 0
+
+    def __call__(self, prompt=''):
+        resposta = self.respostas[self.posicao % len(self.respostas)]
+        self.posicao += 1
+        if resposta == 'yes':
+            self.confirmacoes += 1
+        return resposta
+
+
+# Código executado em um processo novo para medir o import a frio
+STARTUP_ATUAL = """
+import time
+inicio = time.perf_counter()
+import instagram_comment
+print(time.perf_counter() - inicio)
+"""
+
+STARTUP_ANTERIOR = """
+import time
+inicio = time.perf_counter()
+import oci
+import oci.generative_ai_inference.models
+import requests
+from instagrapi import Client
+import instagram_comment
+if instagram_comment.obter_oci_client() is None:
+    raise SystemExit("cliente OCI não foi construído")
+print(time.perf_counter() - inicio)
+"""
+
+
+def gerar_config_oci(diretorio: str) -> dict:
+    """Cria uma chave RSA descartável e variáveis OCI_* fictícias, suficientes para construir o cliente."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    caminho = os.path.join(diretorio, 'oci_benchmark.pem')
+    with open(caminho, 'wb') as f:
+        f.write(chave.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            encryption_algorithm=serialization.NoEncryption()
+        ))
+    return {
+        'OCI_USER': 'ocid1.user.oc1..benchmark',
+        'OCI_KEY_FILE': caminho,
+        'OCI_FINGERPRINT': ':'.join(['00'] * 16),
+        'OCI_TENANCY': 'ocid1.tenancy.oc1..benchmark',
+        'OCI_REGION': 'sa-saopaulo-1',
+    }
+
+
+def medir_startup(repeticoes: int):
+    """Mede o import a frio em processos novos, com e sem os imports pesados.
+
+    O caso anterior constrói de fato o GenerativeAiInferenceClient, usando uma
+    chave descartável; nenhuma chamada de rede é feita.
+    """
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, USE_MOCKS='true', USE_MOCK_LLM='false')
+
+    print("\n🚀 Tempo de import a frio:")
+    print("=" * 50)
+    with tempfile.TemporaryDirectory(prefix='unfluencer-startup-') as temporario:
+        try:
+            env_anterior = dict(env, **gerar_config_oci(temporario))
+        except ImportError as e:
+            env_anterior = None
+            print(f"imports e cliente no import: não foi possível gerar a chave de teste ({e})")
+
+        for nome, codigo, env_caso in (("sob demanda (atual)", STARTUP_ATUAL, env),
+                                       ("imports e cliente no import", STARTUP_ANTERIOR, env_anterior)):
+            if env_caso is not None:
+                medir_processo(nome, codigo, env_caso, diretorio, repeticoes)
+    print("=" * 50)
+
+
+def medir_processo(nome: str, codigo: str, env: dict, diretorio: str, repeticoes: int):
+    """Roda `codigo` em processos novos e mostra a mediana do tempo impresso por ele."""
+    tempos = []
+    for _ in range(repeticoes):
+        resultado = subprocess.run([sys.executable, '-c', codigo], cwd=diretorio, env=env,
+                                   capture_output=True, text=True)
+        if resultado.returncode != 0:
+            erro = resultado.stderr.strip().splitlines()[-1] if resultado.stderr.strip() else "erro desconhecido"
+            print(f"{nome}: não foi possível medir ({erro})")
+            break
+        tempos.append(float(resultado.stdout.strip().splitlines()[-1]))
+    if tempos:
+        print(f"{nome}: mediana {statistics.median(tempos):.3f}s, mín {min(tempos):.3f}s ({len(tempos)} execuções)")
+
+
+def montar_prompt_sem_cache(comentario: str, contexto: str) -> str:
+    """Montagem do prompt como era feita antes: relê o arquivo e recompila a regex."""
+    with open('prompt.json', 'r', encoding='utf-8') as f:
+        prompt_data = json.load(f)['prompt']
+    emoji_pattern = re.compile("["
+        u"\U0001F600-\U0001F64F"
+        u"\U0001F300-\U0001F5FF"
+        u"\U0001F680-\U0001F6FF"
+        u"\U0001F1E0-\U0001F1FF"
+        u"\U00002702-\U000027B0"
+        u"\U000024C2-\U0001F251"
+        "]+", flags=re.UNICODE)
+    comentario_limpo = emoji_pattern.sub('', comentario)
+    prompt_text = "\n".join(prompt_data['instructions'])
+    prompt_text += "\n\n" + contexto
+    prompt_text += "\n\n" + prompt_data['comment_template'].format(comment=comentario_limpo)
+    return prompt_text
+
+
+def medir_prompt(repeticoes: int):
+    """Compara a montagem do prompt com e sem o PromptConfig."""
+    import instagram_comment
+
+    comentario = "Que post incrível! 👏"
+    contexto = "Análise do post:\nA imagem mostra batatas sobre uma mesa."
+
+    def montar_com_cache():
+        instagram_comment.carregar_prompt()
+        return instagram_comment.prompt_config.montar(
+            contexto, instagram_comment.limpar_comentario(comentario)
+        )
+
+    if montar_com_cache() != montar_prompt_sem_cache(comentario, contexto):
+        print("⚠️ Os dois métodos montaram prompts diferentes")
+
+    print("\n🧩 Montagem do prompt:")
+    print("=" * 50)
+    for nome, funcao in (("sem cache (anterior)", lambda: montar_prompt_sem_cache(comentario, contexto)),
+                         ("PromptConfig (atual)", montar_com_cache)):
+        tempo = min(timeit.repeat(funcao, number=repeticoes, repeat=5)) / repeticoes
+        print(f"{nome}: {tempo * 1e6:.1f} µs por resposta")
+    print("=" * 50)
+
+
+def relatorio_etapas(resumo: list):
+    largura = max([len(item['etapa']) for item in resumo] + [5]) + 2
+    print("\n⏱️ Tempo por etapa:")
+    print("=" * (largura + 42))
+    print(f"{'Etapa':<{largura}}{'n':>5}{'p50 (s)':>9}{'p90 (s)':>9}{'máx (s)':>9}{'total (s)':>10}")
+    for item in resumo:
+        p = item["percentis"]
+        print(f"{item['etapa']:<{largura}}{item['contagem']:>5}{p['p50']:>9.3f}{p['p90']:>9.3f}"
+              f"{item['max']:>9.3f}{item['soma']:>10.3f}")
+    print("=" * (largura + 42))
+
+
+def total_respostas(pipeline_estatisticas: dict) -> int:
+    return sum(estatistica["respostas"] for estatistica in pipeline_estatisticas.values())
+
+
+def executar_fluxo(args) -> bool:
+    """Roda as iterações do fluxo completo; retorna False se alguma não gerou resposta."""
+    import instagram_comment
+    from instagram_mocks import MOCK_MEDIA, MockInferenceClient, MockInstagramClient
+
+    servidor = iniciar_servidor_imagem(gerar_imagem_fixture())
+    url_imagem = f"http://127.0.0.1:{servidor.server_address[1]}/imagem.jpg"
+
+    recurso = dataclasses.replace(MOCK_MEDIA.resources[0], thumbnail_url=url_imagem)
+    media = dataclasses.replace(MOCK_MEDIA, thumbnail_url=url_imagem, resources=[recurso])
+    client = MockInstagramClient(media=media)
+
+    instagram_comment.oci_client = MockInferenceClient(intervalo_stream=args.intervalo_stream, latencia=args.latencia)
+    if args.modo:
+        instagram_comment.PIPELINE_MODE = args.modo
+    instagram_comment.STREAM_RESPONSES = args.stream
+    instagram_comment.analise_cache.ignorar = args.sem_cache
+
+    if args.modo_comentario == '1':
+        roteiro = RoteiroInput(['1', '1', 'yes'])
+    else:
+        roteiro = RoteiroInput(['2', 'yes'])
+
+    input_original = builtins.input
+    builtins.input = roteiro
+    inicio = time.perf_counter()
+    falha = None
+    try:
+        instagram_comment.realizar_login(client, 'benchmark', 'benchmark')
+        for iteracao in range(1, args.iteracoes + 1):
+            if args.sem_cache:
+                instagram_comment.image_cache.limpar()
+            respostas_antes = total_respostas(instagram_comment.pipeline_estatisticas)
+            confirmacoes_antes = roteiro.confirmacoes
+            instagram_comment.processar_usuario(client, media.user.username)
+            if (total_respostas(instagram_comment.pipeline_estatisticas) == respostas_antes
+                    or roteiro.confirmacoes == confirmacoes_antes):
+                falha = iteracao
+                break
+    finally:
+        builtins.input = input_original
+        servidor.shutdown()
+        servidor.server_close()
+        instagram_comment.analise_cache.fechar()
+    total = time.perf_counter() - inicio
+
+    if falha is not None:
+        print(f"\n❌ Iteração {falha}: nenhuma resposta foi gerada e confirmada. "
+              "Veja o log acima; os tempos desta execução não são válidos.")
+        return False
+
+    relatorio_etapas(instagram_comment.metricas.resumo())
+    if args.metricas:
+        instagram_comment.metricas.exportar(args.metricas)
+    instagram_comment.relatorio_pipeline()
+    print(f"Cache de imagens: {instagram_comment.image_cache.estatisticas()}")
+    print(f"Cache de análises: {instagram_comment.analise_cache.estatisticas()}")
+    print(f"Total: {total:.2f}s em {args.iteracoes} iteração(ões)")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline do Unfluencer")
+    parser.add_argument('--iteracoes', type=int, default=3)
+    parser.add_argument('--latencia', type=float, default=0.2,
+                        help="latência simulada de cada chamada ao modelo, em segundos")
+    parser.add_argument('--modo', default=None, help="modo do pipeline (duplo, texto ou unico)")
+    parser.add_argument('--stream', action='store_true', help="gera a resposta em streaming")
+    parser.add_argument('--intervalo-stream', type=float, default=0.02,
+                        help="intervalo simulado entre os pedaços do stream, em segundos")
+    parser.add_argument('--sem-cache', action='store_true',
+                        help="limpa os caches de imagem e análise entre as iterações")
+    parser.add_argument('--modo-comentario', choices=['1', '2'], default='1',
+                        help="1 responde ao primeiro comentário, 2 comenta no post")
+    parser.add_argument('--metricas', default=None,
+                        help="arquivo para exportar as métricas (.json ou .prom)")
+    parser.add_argument('--startup', action='store_true',
+                        help="mede apenas o tempo de import a frio de instagram_comment")
+    parser.add_argument('--repeticoes', type=int, default=5,
+                        help="quantidade de processos usados em --startup")
+    parser.add_argument('--prompt', action='store_true',
+                        help="mede apenas a montagem do prompt")
+    args = parser.parse_args()
+
+    if args.startup:
+        medir_startup(args.repeticoes)
+        return
+    if args.metricas:
+        args.metricas = os.path.abspath(args.metricas)
+
+    diretorio_original = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='unfluencer-benchmark-') as diretorio:
+        preparar_diretorio(diretorio)
+        os.chdir(diretorio)
+        try:
+            if args.prompt:
+                medir_prompt(2000)
+                return
+            sucesso = executar_fluxo(args)
+        finally:
+            os.chdir(diretorio_original)
+
+    if not sucesso:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
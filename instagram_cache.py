@@ -0,0 +1,322 @@
+import base64
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+logger = logging.getLogger('instagram_bot')
+
+
+def preprocessar_imagem(image_data: bytes, max_dimensao: int = 1024, qualidade: int = 85) -> bytes:
+    """Reduz a imagem para caber em `max_dimensao` e recomprime como JPEG.
+
+    Imagens que já cabem no limite são devolvidas sem alteração, assim como as que
+    ficariam maiores depois de recomprimidas. Com `max_dimensao` <= 0 nada é feito.
+    """
+    if max_dimensao <= 0:
+        return image_data
+
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.info("Pillow não instalado, imagem enviada sem redimensionar")
+        return image_data
+
+    try:
+        with Image.open(io.BytesIO(image_data)) as imagem:
+            if max(imagem.size) <= max_dimensao:
+                logger.info(f"Imagem já é pequena ({imagem.size[0]}x{imagem.size[1]}), mantida sem alteração")
+                return image_data
+
+            imagem.thumbnail((max_dimensao, max_dimensao), Image.LANCZOS)
+            if imagem.mode != 'RGB':
+                imagem = imagem.convert('RGB')
+
+            saida = io.BytesIO()
+            imagem.save(saida, format='JPEG', quality=qualidade, optimize=True)
+            reduzida = saida.getvalue()
+    except Exception as e:
+        logger.info(f"Não foi possível redimensionar imagem: {e}")
+        return image_data
+
+    if len(reduzida) >= len(image_data):
+        logger.info(f"Recompressão não reduziu a imagem ({len(image_data)} bytes), mantida a original")
+        return image_data
+
+    logger.info(f"Imagem redimensionada: {len(image_data)} -> {len(reduzida)} bytes")
+    return reduzida
+
+
+class ImageCache:
+    """Cache das imagens dos posts, já codificadas como data URL.
+
+    Mantém os payloads em um LRU em memória e, opcionalmente, os bytes originais
+    da imagem em disco (limitados em quantidade e idade). Antes de codificar, a
+    imagem é reduzida por `preprocessar_imagem`. A chave é (pk da mídia, URL da
+    thumbnail), então a análise e a geração de resposta do mesmo post
+    compartilham um único download.
+    """
+
+    def __init__(self, max_itens: int = 32, diretorio: Optional[str] = None,
+                 timeout: Tuple[float, float] = (5, 30), max_dimensao: int = 1024,
+                 qualidade_jpeg: int = 85, max_itens_disco: int = 256,
+                 ttl_disco: float = 7 * 24 * 3600):
+        self.max_itens = max(1, max_itens)
+        self.diretorio = diretorio
+        self.max_itens_disco = max(1, max_itens_disco)
+        self.ttl_disco = ttl_disco
+        self.timeout = timeout
+        self.max_dimensao = max_dimensao
+        self.qualidade_jpeg = qualidade_jpeg
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self._session = None
+
+        if self.diretorio:
+            os.makedirs(self.diretorio, exist_ok=True)
+
+    def _obter_session(self):
+        """Cria a sessão HTTP (com pool de conexões) na primeira vez que é necessária."""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    def _caminho_disco(self, chave: Tuple[int, str]) -> Optional[str]:
+        if not self.diretorio:
+            return None
+        nome = hashlib.sha256(f"{chave[0]}:{chave[1]}".encode('utf-8')).hexdigest()
+        return os.path.join(self.diretorio, f"{nome}.jpg")
+
+    def _ler_disco(self, chave: Tuple[int, str]) -> Optional[bytes]:
+        caminho = self._caminho_disco(chave)
+        if not caminho or not os.path.exists(caminho):
+            return None
+        try:
+            if time.time() - os.path.getmtime(caminho) > self.ttl_disco:
+                os.remove(caminho)
+                return None
+            with open(caminho, 'rb') as f:
+                image_data = f.read()
+            # Atualiza o mtime para que a limpeza descarte primeiro as menos usadas
+            os.utime(caminho)
+            return image_data
+        except OSError as e:
+            logger.info(f"Não foi possível ler imagem do cache em disco: {e}")
+            return None
+
+    def _gravar_disco(self, chave: Tuple[int, str], image_data: bytes):
+        caminho = self._caminho_disco(chave)
+        if not caminho:
+            return
+        try:
+            temporario = f"{caminho}.tmp"
+            with open(temporario, 'wb') as f:
+                f.write(image_data)
+            os.replace(temporario, caminho)
+        except OSError as e:
+            logger.info(f"Não foi possível gravar imagem no cache em disco: {e}")
+            try:
+                os.remove(temporario)
+            except OSError:
+                pass
+            return
+        self._limpar_disco()
+
+    def _limpar_disco(self):
+        """Remove do disco as imagens expiradas e as menos usadas além de `max_itens_disco`.
+
+        Arquivos `.jpg.tmp` deixados por gravações interrompidas também contam.
+        """
+        try:
+            arquivos = []
+            for entrada in os.scandir(self.diretorio):
+                if entrada.is_file() and entrada.name.endswith(('.jpg', '.jpg.tmp')):
+                    arquivos.append((entrada.stat().st_mtime, entrada.path))
+        except OSError as e:
+            logger.info(f"Não foi possível listar o cache em disco: {e}")
+            return
+
+        arquivos.sort(reverse=True)
+        limite = time.time() - self.ttl_disco
+        for posicao, (mtime, caminho) in enumerate(arquivos):
+            if posicao >= self.max_itens_disco or mtime < limite:
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+
+    def _baixar(self, image_url: str) -> bytes:
+        response = self._obter_session().get(image_url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    def _guardar(self, chave: Tuple[int, str], base64_image_url: str):
+        with self._lock:
+            self._itens[chave] = base64_image_url
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def obter(self, media_pk, image_url: str) -> str:
+        """Retorna a imagem como data URL base64, baixando-a apenas se necessário."""
+        chave = (media_pk, image_url)
+
+        with self._lock:
+            base64_image_url = self._itens.get(chave)
+            if base64_image_url is not None:
+                self._itens.move_to_end(chave)
+                self.hits += 1
+                logger.info("Imagem obtida do cache em memória")
+                return base64_image_url
+
+        image_data = self._ler_disco(chave)
+        if image_data is not None:
+            with self._lock:
+                self.disk_hits += 1
+            logger.info("Imagem obtida do cache em disco")
+        else:
+            image_data = self._baixar(image_url)
+            with self._lock:
+                self.misses += 1
+            logger.info(f"Imagem baixada ({len(image_data)} bytes)")
+            self._gravar_disco(chave, image_data)
+
+        image_data = preprocessar_imagem(image_data, self.max_dimensao, self.qualidade_jpeg)
+        base64_image_url = "data:image/jpeg;base64," + base64.b64encode(image_data).decode("utf-8")
+        self._guardar(chave, base64_image_url)
+        return base64_image_url
+
+    def limpar(self):
+        """Esvazia o cache em memória e zera os contadores."""
+        with self._lock:
+            self._itens.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "itens": len(self._itens),
+            }
+
+
+class AnaliseCache:
+    """Armazena em SQLite as análises de imagem já feitas pelo modelo de visão.
+
+    A chave é o pk da mídia mais um hash da legenda e da imagem, então a análise
+    só é refeita quando o conteúdo do post muda. Entradas mais antigas que o TTL
+    são descartadas e o total é limitado a `max_itens` (as mais antigas saem primeiro).
+    """
+
+    def __init__(self, caminho: str = 'analise_cache.sqlite3', ttl: float = 7 * 24 * 3600,
+                 max_itens: int = 500, ignorar: bool = False):
+        self.caminho = caminho
+        self.ttl = ttl
+        self.max_itens = max(1, max_itens)
+        self.ignorar = ignorar
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conexao = None
+
+    def _conectar(self):
+        if self._conexao is None:
+            self._conexao = sqlite3.connect(self.caminho, check_same_thread=False)
+            self._conexao.execute(
+                """CREATE TABLE IF NOT EXISTS analises (
+                    media_pk TEXT NOT NULL,
+                    conteudo_hash TEXT NOT NULL,
+                    analise TEXT NOT NULL,
+                    criado_em REAL NOT NULL,
+                    PRIMARY KEY (media_pk, conteudo_hash)
+                )"""
+            )
+            self._conexao.execute(
+                "CREATE INDEX IF NOT EXISTS idx_analises_criado_em ON analises (criado_em)"
+            )
+            self._conexao.commit()
+        return self._conexao
+
+    @staticmethod
+    def gerar_hash(*partes: str) -> str:
+        """Hash do conteúdo que determina a análise (modelo, prompt, legenda, imagem)."""
+        digest = hashlib.sha256()
+        for parte in partes:
+            digest.update((parte or '').encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def obter(self, media_pk, conteudo_hash: str) -> Optional[str]:
+        """Retorna a análise salva, ou None se não existir, estiver expirada ou o cache for ignorado."""
+        if self.ignorar:
+            return None
+        try:
+            with self._lock:
+                conexao = self._conectar()
+                linha = conexao.execute(
+                    "SELECT analise, criado_em FROM analises WHERE media_pk = ? AND conteudo_hash = ?",
+                    (str(media_pk), conteudo_hash)
+                ).fetchone()
+                if linha and time.time() - linha[1] <= self.ttl:
+                    self.hits += 1
+                    return linha[0]
+                if linha:
+                    conexao.execute(
+                        "DELETE FROM analises WHERE media_pk = ? AND conteudo_hash = ?",
+                        (str(media_pk), conteudo_hash)
+                    )
+                    conexao.commit()
+                self.misses += 1
+                return None
+        except sqlite3.Error as e:
+            logger.info(f"Não foi possível ler o cache de análises: {e}")
+            return None
+
+    def salvar(self, media_pk, conteudo_hash: str, analise: str):
+        if self.ignorar:
+            return
+        try:
+            with self._lock:
+                conexao = self._conectar()
+                agora = time.time()
+                conexao.execute(
+                    "INSERT OR REPLACE INTO analises (media_pk, conteudo_hash, analise, criado_em) VALUES (?, ?, ?, ?)",
+                    (str(media_pk), conteudo_hash, analise, agora)
+                )
+                conexao.execute("DELETE FROM analises WHERE criado_em < ?", (agora - self.ttl,))
+                conexao.execute(
+                    """DELETE FROM analises WHERE rowid NOT IN (
+                        SELECT rowid FROM analises ORDER BY criado_em DESC LIMIT ?
+                    )""",
+                    (self.max_itens,)
+                )
+                conexao.commit()
+        except sqlite3.Error as e:
+            logger.info(f"Não foi possível gravar no cache de análises: {e}")
+
+    def fechar(self):
+        with self._lock:
+            if self._conexao is not None:
+                self._conexao.close()
+                self._conexao = None
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "ignorado": self.ignorar}
@@ -1,16 +1,16 @@
-from instagrapi import Client
 from dotenv import load_dotenv
 import os
 import time
+import atexit
 import logging
-import oci
-import oci.generative_ai_inference.models
-import requests
-import base64
 import json
+import re
+import threading
 from typing import List, Optional
 from datetime import datetime
-from instagram_mocks import MockInstagramClient
+from instagram_mocks import MockInstagramClient, MockInferenceClient, mock_models
+from instagram_cache import ImageCache, AnaliseCache
+from instagram_metricas import MetricsRegistry
 
 # Configurar logging
 logging.basicConfig(
@@ -23,16 +23,68 @@ logger = logging.getLogger('instagram_bot')
 load_dotenv()
 
 USE_MOCKS = os.getenv('USE_MOCKS', 'false').lower() == 'true'
+USE_MOCK_LLM = os.getenv('USE_MOCK_LLM', 'false').lower() == 'true'
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'false').lower() == 'true'
 session_file = 'instagram_session.json'
+user_ids_file = os.getenv('USER_ID_CACHE_FILE', 'instagram_user_ids.json')
+user_ids_cache = None
+USER_ID_CACHE_TTL = float(os.getenv('USER_ID_CACHE_TTL', str(7 * 24 * 3600)))
+
+# Paginação da busca pelo último post com foto
+MEDIA_SCAN_LIMIT = max(1, int(os.getenv('MEDIA_SCAN_LIMIT', '20')))
+
+# Remove emojis e outros caracteres especiais não desejados, mantendo acentos
+EMOJI_PATTERN = re.compile("["
+    u"\U0001F600-\U0001F64F"  # emoticons
+    u"\U0001F300-\U0001F5FF"  # símbolos & pictogramas
+    u"\U0001F680-\U0001F6FF"  # transport & map symbols
+    u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
+    u"\U00002702-\U000027B0"
+    u"\U000024C2-\U0001F251"
+    "]+", flags=re.UNICODE)
+
+def limpar_comentario(texto: str) -> str:
+    return EMOJI_PATTERN.sub('', texto)
+
+class PromptConfig:
+    """Mantém o prompt.json carregado, relendo o arquivo apenas quando o mtime muda."""
+
+    def __init__(self, caminho: str = 'prompt.json'):
+        self.caminho = caminho
+        self.dados = None
+        self.instrucoes = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def obter(self):
+        """Retorna a seção "prompt" do arquivo, ou None se não puder ser carregada."""
+        try:
+            mtime = os.stat(self.caminho).st_mtime_ns
+            with self._lock:
+                if mtime != self._mtime:
+                    with open(self.caminho, 'r', encoding='utf-8') as f:
+                        dados = json.load(f)['prompt']
+                    self.instrucoes = "\n".join(dados['instructions'])
+                    self.dados = dados
+                    self._mtime = mtime
+                    logger.info(f"{self.caminho} carregado")
+                return self.dados
+        except Exception as e:
+            logger.info(f"Não foi possível carregar {self.caminho}: {str(e)}")
+            return None
+
+    def montar(self, contexto: str, comentario: str) -> str:
+        """Monta o prompt completo: instruções, contexto do post e comentário."""
+        return (
+            self.instrucoes
+            + "\n\n" + contexto
+            + "\n\n" + self.dados['comment_template'].format(comment=comentario)
+        )
+
+prompt_config = PromptConfig(os.getenv('PROMPT_FILE', 'prompt.json'))
 
 def carregar_prompt():
-    try:
-        with open('prompt.json', 'r', encoding='utf-8') as f:
-            prompt_data = json.load(f)
-            return prompt_data['prompt']
-    except Exception as e:
-        logger.info(f"Não foi possível carregar prompt.json: {str(e)}")
-        return None
+    return prompt_config.obter()
 
 def carregar_usuarios() -> List[str]:
     """Carrega a lista de usuários do arquivo .env"""
@@ -52,45 +104,177 @@ config = {
     "region": os.getenv('OCI_REGION')
 }
 
-try:
-    if not os.path.exists(config["key_file"]):
-        logger.info(f"Arquivo de chave não encontrado: {config['key_file']}")
-        raise FileNotFoundError(f"Arquivo de chave não encontrado: {config['key_file']}")
+# O cliente OCI (e o import do SDK, que é pesado) só é criado na primeira chamada ao modelo
+oci_client = None
+_oci_client_inicializado = False
+_oci_client_lock = threading.Lock()
+
+def criar_oci_client():
+    """Constrói o cliente de inferência (ou o simulado, com USE_MOCK_LLM)."""
+    if USE_MOCK_LLM:
+        logger.info("Usando cliente de inferência simulado")
+        return MockInferenceClient()
+
+    try:
+        import oci
+
+        if not os.path.exists(config["key_file"]):
+            logger.info(f"Arquivo de chave não encontrado: {config['key_file']}")
+            raise FileNotFoundError(f"Arquivo de chave não encontrado: {config['key_file']}")
     
-    logger.info("Tentando inicializar cliente OCI com as seguintes configurações:")
-    logger.info(f"User: {config['user']}")
-    logger.info(f"Key File: {config['key_file']}")
-    logger.info(f"Fingerprint: {config['fingerprint']}")
-    logger.info(f"Tenancy: {config['tenancy']}")
-    logger.info(f"Region: {config['region']}")
+        logger.info("Tentando inicializar cliente OCI com as seguintes configurações:")
+        logger.info(f"User: {config['user']}")
+        logger.info(f"Key File: {config['key_file']}")
+        logger.info(f"Fingerprint: {config['fingerprint']}")
+        logger.info(f"Tenancy: {config['tenancy']}")
+        logger.info(f"Region: {config['region']}")
+    
+        endpoint = f"https://inference.generativeai.{config['region']}.oci.oraclecloud.com"
+        logger.info(f"Endpoint: {endpoint}")
+    
+        client = oci.generative_ai_inference.GenerativeAiInferenceClient(
+            config=config,
+            service_endpoint=endpoint,
+            retry_strategy=oci.retry.NoneRetryStrategy(),
+            timeout=(100, 240)
+        )
+        logger.info("Cliente OCI inicializado com sucesso!")
+        return client
+    except FileNotFoundError as e:
+        logger.info(f"Arquivo não encontrado: {str(e)}")
+        return None
+    except Exception as e:
+        logger.info(f"Não foi possível inicializar cliente OCI: {str(e)}")
+        logger.info(f"Tipo do erro: {type(e).__name__}")
+        return None
+
+def obter_modelos():
+    """Retorna os modelos de requisição do SDK da OCI (ou os simulados, com USE_MOCK_LLM).
     
-    endpoint = f"https://inference.generativeai.{config['region']}.oci.oraclecloud.com"
-    logger.info(f"Endpoint: {endpoint}")
+    Retorna None se o SDK não estiver instalado.
+    """
+    if USE_MOCK_LLM:
+        return mock_models
     
-    oci_client = oci.generative_ai_inference.GenerativeAiInferenceClient(
-        config=config,
-        service_endpoint=endpoint,
-        retry_strategy=oci.retry.NoneRetryStrategy(),
-        timeout=(100, 240)
+    try:
+        import oci.generative_ai_inference.models
+        return oci.generative_ai_inference.models
+    except ImportError as e:
+        logger.info(f"Não foi possível importar o SDK da OCI: {str(e)}")
+        return None
+
+def obter_oci_client():
+    """Retorna o cliente OCI, criando-o uma única vez no primeiro uso."""
+    global oci_client, _oci_client_inicializado
+    if oci_client is not None or _oci_client_inicializado:
+        return oci_client
+    with _oci_client_lock:
+        if not _oci_client_inicializado:
+            oci_client = criar_oci_client()
+            _oci_client_inicializado = True
+    return oci_client
+
+image_cache = ImageCache(
+    max_itens=int(os.getenv('IMAGE_CACHE_SIZE', '32')),
+    diretorio=os.getenv('IMAGE_CACHE_DIR') or None,
+    max_dimensao=int(os.getenv('IMAGE_MAX_DIMENSION', '1024')),
+    qualidade_jpeg=int(os.getenv('IMAGE_JPEG_QUALITY', '85')),
+    max_itens_disco=int(os.getenv('IMAGE_CACHE_DISK_SIZE', '256')),
+    ttl_disco=float(os.getenv('IMAGE_CACHE_DISK_TTL', str(7 * 24 * 3600)))
+)
+
+analise_cache = AnaliseCache(
+    caminho=os.getenv('ANALYSIS_CACHE_DB', 'analise_cache.sqlite3'),
+    ttl=float(os.getenv('ANALYSIS_CACHE_TTL', str(7 * 24 * 3600))),
+    max_itens=int(os.getenv('ANALYSIS_CACHE_SIZE', '500')),
+    ignorar=os.getenv('ANALYSIS_CACHE_BYPASS', 'false').lower() == 'true'
+)
+
+# Modos do pipeline de inferência:
+# - duplo: análise multimodal + geração multimodal (comportamento original)
+# - texto: análise multimodal (com cache) + geração só com texto, reaproveitando a análise
+# - unico: uma única requisição multimodal que analisa o post e já gera a resposta
+PIPELINE_MODES = ('duplo', 'texto', 'unico')
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'duplo').lower()
+
+# Contexto usado no modo "unico" (e quando a análise falha) se prompt.json não define "single_pass_context"
+PROMPT_UNICO_CONTEXTO = """Antes de responder, observe a imagem anexada e a legenda do post, considerando o que aparece na imagem, o contexto da legenda e o tom do post.
+
+Legenda: {legenda}"""
+
+# Totais das chamadas ao modelo, usados para comparar os modos do pipeline
+chat_contadores = {"requisicoes": 0, "bytes": 0}
+pipeline_estatisticas = {}
+
+def tamanho_request(chat_request) -> int:
+    """Estima o tamanho em bytes do conteúdo enviado em um GenericChatRequest."""
+    total = 0
+    for msg in chat_request.messages:
+        for content in msg.content:
+            if getattr(content, 'text', None):
+                total += len(content.text.encode('utf-8'))
+            if getattr(content, 'image_url', None):
+                total += len(content.image_url.url)
+    return total
+
+def enviar_chat(chat_detail):
+    """Envia a requisição ao modelo contabilizando quantidade e bytes enviados."""
+    chat_contadores["requisicoes"] += 1
+    chat_contadores["bytes"] += tamanho_request(chat_detail.chat_request)
+    with metricas.span("Chamada ao modelo"):
+        return obter_oci_client().chat(chat_detail)
+
+def ler_stream(chat_response) -> str:
+    """Mostra os tokens do stream à medida que chegam e devolve o texto completo."""
+    partes = []
+    for event in chat_response.data.events():
+        dados = json.loads(event.data)
+        for content in dados.get('message', {}).get('content', []):
+            texto = content.get('text')
+            if texto:
+                print(texto, end='', flush=True)
+                partes.append(texto)
+    print()
+    return "".join(partes)
+
+def registrar_pipeline(modo: str, duracao: float, requisicoes: int, bytes_enviados: int):
+    estatistica = pipeline_estatisticas.setdefault(
+        modo, {"respostas": 0, "tempo_total": 0.0, "requisicoes": 0, "bytes": 0}
+    )
+    estatistica["respostas"] += 1
+    estatistica["tempo_total"] += duracao
+    estatistica["requisicoes"] += requisicoes
+    estatistica["bytes"] += bytes_enviados
+    logger.info(
+        f"Pipeline '{modo}': {duracao:.2f}s, {requisicoes} requisição(ões), {bytes_enviados} bytes enviados"
     )
-    logger.info("Cliente OCI inicializado com sucesso!")
-except FileNotFoundError as e:
-    logger.info(f"Arquivo não encontrado: {str(e)}")
-    oci_client = None
-except Exception as e:
-    logger.info(f"Não foi possível inicializar cliente OCI: {str(e)}")
-    logger.info(f"Tipo do erro: {type(e).__name__}")
-    oci_client = None
+
+def relatorio_pipeline():
+    for modo, estatistica in pipeline_estatisticas.items():
+        respostas = estatistica["respostas"]
+        logger.info(
+            f"Pipeline '{modo}': {respostas} resposta(s), "
+            f"média {estatistica['tempo_total'] / respostas:.2f}s e "
+            f"{estatistica['bytes'] // respostas} bytes por resposta"
+        )
+
+# Spans das etapas por usuário; exportados ao sair se METRICS_FILE estiver definido
+metricas = MetricsRegistry()
+METRICS_FILE = os.getenv('METRICS_FILE')
+if METRICS_FILE:
+    atexit.register(metricas.exportar, METRICS_FILE, os.getenv('METRICS_FORMAT') or None)
 
 def time_execution(func_name):
     def decorator(func):
         def wrapper(*args, **kwargs):
             logger.info(f"Iniciando {func_name}...")
             start = time.time()
-            result = func(*args, **kwargs)
-            duration = time.time() - start
-            logger.info(f"{func_name} concluído em {duration:.2f} segundos")
-            return result
+            try:
+                with metricas.span(func_name):
+                    return func(*args, **kwargs)
+            finally:
+                duration = time.time() - start
+                logger.info(f"{func_name} concluído em {duration:.2f} segundos")
         return wrapper
     return decorator
 
@@ -119,47 +303,132 @@ def realizar_login(client, username, password):
         logger.error(f"Erro ao fazer login: {e}")
         return False
 
+def carregar_user_ids() -> dict:
+    """Carrega o cache de username -> user_id salvo em execuções anteriores."""
+    global user_ids_cache
+    if user_ids_cache is None:
+        user_ids_cache = {}
+        if os.path.exists(user_ids_file):
+            try:
+                with open(user_ids_file, 'r', encoding='utf-8') as f:
+                    user_ids_cache = json.load(f)
+            except Exception as e:
+                logger.info(f"Não foi possível carregar {user_ids_file}: {str(e)}")
+    return user_ids_cache
+
+def salvar_user_ids():
+    try:
+        with open(user_ids_file, 'w', encoding='utf-8') as f:
+            json.dump(carregar_user_ids(), f)
+    except Exception as e:
+        logger.info(f"Não foi possível salvar {user_ids_file}: {str(e)}")
+
+def descartar_user_id(username: str):
+    if carregar_user_ids().pop(username, None) is not None:
+        salvar_user_ids()
+
+def obter_user_id(client, username: str):
+    """Retorna o ID do usuário e se ele veio do cache.
+    
+    A API só é consultada se o ID não estiver em cache ou tiver expirado
+    (USER_ID_CACHE_TTL). Com USE_MOCKS o cache não é lido nem gravado, para que
+    IDs fictícios não sejam usados em execuções reais.
+    """
+    if USE_MOCKS:
+        return client.user_id_from_username(username), False
+    
+    user_ids = carregar_user_ids()
+    entrada = user_ids.get(username)
+    if isinstance(entrada, dict) and time.time() - entrada.get('salvo_em', 0) <= USER_ID_CACHE_TTL:
+        logger.info(f"ID do usuário obtido do cache: {entrada['user_id']}")
+        return entrada['user_id'], True
+    
+    user_id = client.user_id_from_username(username)
+    user_ids[username] = {"user_id": user_id, "salvo_em": time.time()}
+    salvar_user_ids()
+    return user_id, False
+
+def post_pertence_ao_usuario(media, username: str) -> bool:
+    """Confere se o dono do post é `username` (quando a API informa o dono)."""
+    dono = getattr(getattr(media, 'user', None), 'username', None)
+    return dono is None or dono.lower() == username.lower()
+
+def post_e_foto(media) -> bool:
+    """Verifica se o post é uma foto ou um carrossel que começa com uma foto."""
+    logger.debug(f"Tipo de mídia: {media.media_type}")
+    logger.debug(f"Legenda: {(media.caption_text or '')[:100]}...")
+    
+    # Foto única (media_type 1)
+    if media.media_type == 1:
+        logger.info("Foto única encontrada")
+        return True
+    
+    # Carrossel (media_type 8): verifica se a primeira mídia é uma foto
+    if media.media_type == 8:
+        if hasattr(media, 'resources') and media.resources:
+            first_resource = media.resources[0]
+            logger.debug(f"Primeiro recurso do carrossel - Tipo: {first_resource.media_type}")
+            if first_resource.media_type == 1:
+                logger.info("Carrossel válido encontrado (primeira mídia é foto)")
+                return True
+        else:
+            logger.debug("Carrossel sem recursos")
+        return False
+    
+    logger.debug(f"Post ignorado - tipo de mídia não suportado: {media.media_type}")
+    return False
+
 @time_execution("Obtenção do último post")
 def obter_ultimo_post_foto(client, username: str):
-    """Obtém o último post que seja uma foto do usuário especificado"""
+    """Obtém o último post que seja uma foto do usuário especificado.
+    
+    Os posts são buscados uma página do feed por vez, parando no primeiro que
+    for uma foto (no máximo MEDIA_SCAN_LIMIT posts).
+    """
+    user_id = None
     try:
         logger.info(f"Buscando posts do usuário {username}")
-        user_id = client.user_id_from_username(username)
+        user_id, do_cache = obter_user_id(client, username)
         logger.info(f"ID do usuário: {user_id}")
         
-        medias = client.user_medias(user_id, 20)  # Busca os últimos 20 posts
-        logger.info(f"Total de posts encontrados: {len(medias)}")
-        
-        for i, media in enumerate(medias, 1):
-            logger.info(f"\nAnalisando post {i}:")
-            logger.info(f"Tipo de mídia: {media.media_type}")
-            logger.info(f"Legenda: {media.caption_text[:100]}...")
+        analisados = 0
+        end_cursor = ""
+        while analisados < MEDIA_SCAN_LIMIT:
+            # amount=0 pede a página inteira: o instagrapi corta a lista em `amount`, mas
+            # devolve o cursor do fim da página do feed, e os posts cortados se perderiam
+            medias, end_cursor = client.user_medias_paginated(user_id, 0, end_cursor=end_cursor)
+            logger.info(f"Página com {len(medias)} post(s) recebida")
             
-            # Verifica se é uma foto (media_type 1) ou carrossel (media_type 8)
-            if media.media_type in [1, 8]:
-                # Se for carrossel, verifica se tem recursos e se o primeiro é uma foto
-                if media.media_type == 8:
-                    logger.info("Post é um carrossel")
-                    if hasattr(media, 'resources') and media.resources:
-                        first_resource = media.resources[0]
-                        logger.info(f"Primeiro recurso do carrossel - Tipo: {first_resource.media_type}")
-                        if first_resource.media_type == 1:  # Verifica se a primeira mídia é uma foto
-                            logger.info("Carrossel válido encontrado (primeira mídia é foto)")
-                            return media
-                    else:
-                        logger.info("Carrossel sem recursos")
-                # Se for uma foto única, retorna direto
-                elif media.media_type == 1:
-                    logger.info("Foto única encontrada")
+            # Um ID em cache pode ser de uma conta renomeada ou de outra pessoa
+            if do_cache and medias and not post_pertence_ao_usuario(medias[0], username):
+                logger.warning(f"ID em cache não pertence mais a {username}, consultando novamente")
+                descartar_user_id(username)
+                user_id, do_cache = obter_user_id(client, username)
+                logger.info(f"ID do usuário: {user_id}")
+                analisados = 0
+                end_cursor = ""
+                continue
+            
+            # Todos os posts da página são verificados antes de pedir a próxima
+            for media in medias:
+                if analisados >= MEDIA_SCAN_LIMIT:
+                    break
+                analisados += 1
+                logger.debug(f"Analisando post {analisados}")
+                if post_e_foto(media):
                     return media
-            else:
-                logger.info(f"Post ignorado - tipo de mídia não suportado: {media.media_type}")
-                
-        logger.info(f"Nenhuma foto encontrada para o usuário {username}")
+            
+            if not medias or not end_cursor:
+                break
+        
+        logger.info(f"Nenhuma foto encontrada para o usuário {username} ({analisados} posts analisados)")
         return None
     except Exception as e:
         logger.info(f"Não foi possível obter posts do usuário {username}: {e}")
         logger.info(f"Tipo do erro: {type(e).__name__}")
+        # Descarta o ID em cache, que pode estar desatualizado
+        if user_id is not None:
+            descartar_user_id(username)
         return None
 
 @time_execution("Obtenção do ID do post")
@@ -182,30 +451,35 @@ def comentar_post(client, media_id, texto):
 def responder_comentario(client, media_id, comentario_id, texto):
     return client.media_comment(media_id, texto, replied_to_comment_id=comentario_id)
 
+def obter_url_imagem(media_info) -> str:
+    """Retorna a URL da imagem do post (primeira imagem, se for carrossel)."""
+    if hasattr(media_info, 'resources') and media_info.resources:
+        logger.info("Post é um carrossel, usando primeira imagem")
+        return media_info.resources[0].thumbnail_url
+    logger.info("Post é uma imagem única")
+    return media_info.thumbnail_url
+
+@time_execution("Obtenção da imagem")
+def obter_imagem_base64(media_info) -> str:
+    """Obtém a imagem do post como data URL base64, reutilizando o cache por post."""
+    image_url = obter_url_imagem(media_info)
+    logger.info(f"URL da imagem: {image_url}")
+    return image_cache.obter(media_info.pk, image_url)
+
 @time_execution("Análise de imagem")
-def analisar_imagem(media_info) -> str:
-    """Analisa a imagem e legenda do post usando o Llama."""
-    if oci_client is None:
-        return "Cliente OCI não inicializado"
+def analisar_imagem(media_info) -> Optional[str]:
+    """Analisa a imagem e legenda do post usando o Llama.
     
+    Retorna None se a análise não puder ser feita (o motivo fica no log).
+    """
     try:
-        if hasattr(media_info, 'resources') and media_info.resources:
-            image_url = media_info.resources[0].thumbnail_url
-            logger.info("Post é um carrossel, analisando primeira imagem")
-        else:
-            image_url = media_info.thumbnail_url
-            logger.info("Post é uma imagem única")
-            
         try:
-            response = requests.get(image_url)
-            response.raise_for_status()
-            image_data = response.content
-            base64_image = base64.b64encode(image_data).decode("utf-8")
-            base64_image_url = f"data:image/jpeg;base64,{base64_image}"
+            base64_image_url = obter_imagem_base64(media_info)
         except Exception as e:
-            logger.info(f"Não foi possível processar imagem: {str(e)}")
-            return f"Não foi possível processar imagem: {str(e)}"
+            logger.error(f"Análise não realizada: não foi possível processar imagem: {str(e)}")
+            return None
         
+        model_id = "meta.llama-3.2-90b-vision-instruct"
         prompt_text = """Analise esta imagem e sua legenda. Descreva em detalhes:
 1. O que você vê na imagem
 2. O contexto da legenda
@@ -214,20 +488,38 @@ def analisar_imagem(media_info) -> str:
 
 Legenda: {legenda}"""
 
-        texto = oci.generative_ai_inference.models.TextContent(
+        conteudo_hash = AnaliseCache.gerar_hash(
+            model_id, prompt_text, media_info.caption_text, base64_image_url
+        )
+        analise_salva = analise_cache.obter(media_info.pk, conteudo_hash)
+        if analise_salva:
+            logger.info("Análise obtida do cache")
+            return analise_salva
+
+        # Só cria o cliente (e importa o SDK) quando a análise não está em cache
+        if obter_oci_client() is None:
+            logger.error("Análise não realizada: cliente OCI não inicializado")
+            return None
+        
+        models = obter_modelos()
+        if models is None:
+            logger.error("Análise não realizada: SDK da OCI não disponível")
+            return None
+
+        texto = models.TextContent(
             text=prompt_text.format(legenda=media_info.caption_text)
         )
         
-        imagem = oci.generative_ai_inference.models.ImageContent(
-            image_url=oci.generative_ai_inference.models.ImageUrl(url=base64_image_url)
+        imagem = models.ImageContent(
+            image_url=models.ImageUrl(url=base64_image_url)
         )
         
-        mensagem = oci.generative_ai_inference.models.UserMessage(
+        mensagem = models.UserMessage(
             role="USER",
             content=[texto, imagem]
         )
 
-        chat_request = oci.generative_ai_inference.models.GenericChatRequest(
+        chat_request = models.GenericChatRequest(
             api_format="GENERIC",
             messages=[mensagem],
             num_generations=1,
@@ -240,90 +532,95 @@ Legenda: {legenda}"""
             top_k=1
         )
 
-        chat_detail = oci.generative_ai_inference.models.ChatDetails(
+        chat_detail = models.ChatDetails(
             compartment_id=os.getenv('OCI_COMPARTMENT_ID'),
-            serving_mode=oci.generative_ai_inference.models.OnDemandServingMode(
-                model_id="meta.llama-3.2-90b-vision-instruct"
+            serving_mode=models.OnDemandServingMode(
+                model_id=model_id
             ),
             chat_request=chat_request
         )
 
-        chat_response = oci_client.chat(chat_detail)
+        chat_response = enviar_chat(chat_detail)
         
         if chat_response and chat_response.data and chat_response.data.chat_response:
             choices = chat_response.data.chat_response.choices
             if choices and len(choices) > 0:
-                return choices[0].message.content[0].text.strip()
+                analise = choices[0].message.content[0].text.strip()
+                analise_cache.salvar(media_info.pk, conteudo_hash, analise)
+                return analise
         
-        return "Não foi possível analisar a imagem"
+        logger.error("Análise não realizada: resposta da API inválida ou vazia")
+        return None
         
     except Exception as e:
-        return f"Erro na análise: {str(e)}"
+        logger.error(f"Erro na análise: {str(e)}")
+        return None
 
 @time_execution("Geração de resposta")
 def gerar_resposta(comentario_texto: str, media_info) -> str:
     """Gera uma resposta usando o modelo Llama via OCI."""
-    if oci_client is None:
+    if obter_oci_client() is None:
         erro = "Cliente OCI não inicializado"
         logger.error(erro)
         return f"Erro: {erro}"
     
+    modo = PIPELINE_MODE
+    if modo not in PIPELINE_MODES:
+        logger.warning(f"Modo de pipeline desconhecido '{modo}', usando 'duplo'")
+        modo = 'duplo'
+    
+    inicio = time.time()
+    requisicoes_inicio = chat_contadores["requisicoes"]
+    bytes_inicio = chat_contadores["bytes"]
+    
     try:
         logger.info("Iniciando geração de resposta...")
         logger.info(f"Comentário recebido: {comentario_texto}")
+        logger.info(f"Modo do pipeline: {modo}")
         
-        # Primeiro, faz a análise da imagem
-        print("\n🔍 Analisando imagem e legenda...")
-        analise = analisar_imagem(media_info)
-        print("\n📊 Análise do post:")
-        print("=" * 50)
-        print(analise)
-        print("=" * 50)
+        models = obter_modelos()
+        if models is None:
+            erro = "SDK da OCI não disponível"
+            logger.error(erro)
+            return f"Erro: {erro}"
+        
+        analise = None
+        if modo != 'unico':
+            # Primeiro, faz a análise da imagem
+            print("\n🔍 Analisando imagem e legenda...")
+            analise = analisar_imagem(media_info)
+            print("\n📊 Análise do post:")
+            print("=" * 50)
+            print(analise or "Não foi possível analisar a imagem")
+            print("=" * 50)
+            if analise is None:
+                # Sem análise, a geração precisa ver a imagem (mesmo no modo texto)
+                logger.warning("Análise indisponível, a imagem será enviada junto com a geração")
         
         prompt_data = carregar_prompt()
         if not prompt_data:
             return "Erro: Não foi possível carregar o prompt"
         
-        if hasattr(media_info, 'resources') and media_info.resources:
-            image_url = media_info.resources[0].thumbnail_url
-            logger.info("Post é um carrossel, usando primeira imagem")
-        else:
-            image_url = media_info.thumbnail_url
-            logger.info("Post é uma imagem única")
-            
-        logger.info(f"URL da imagem: {image_url}")
-        
-        try:
-            response = requests.get(image_url)
-            response.raise_for_status()
-            image_data = response.content
-            base64_image = base64.b64encode(image_data).decode("utf-8")
-            base64_image_url = f"data:image/jpeg;base64,{base64_image}"
-            
-            logger.info("Imagem convertida para base64 com sucesso")
-        except Exception as e:
-            logger.info(f"Não foi possível processar imagem: {str(e)}")
-            return f"Não foi possível processar imagem: {str(e)}"
+        base64_image_url = None
+        if modo != 'texto' or analise is None:
+            try:
+                base64_image_url = obter_imagem_base64(media_info)
+                logger.info("Imagem convertida para base64 com sucesso")
+            except Exception as e:
+                logger.info(f"Não foi possível processar imagem: {str(e)}")
+                return f"Não foi possível processar imagem: {str(e)}"
         
         # Limpa apenas emojis e caracteres não desejados, mantendo acentos
-        import re
-        # Remove emojis e outros caracteres especiais não desejados
-        emoji_pattern = re.compile("["
-            u"\U0001F600-\U0001F64F"  # emoticons
-            u"\U0001F300-\U0001F5FF"  # símbolos & pictogramas
-            u"\U0001F680-\U0001F6FF"  # transport & map symbols
-            u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-            u"\U00002702-\U000027B0"
-            u"\U000024C2-\U0001F251"
-            "]+", flags=re.UNICODE)
-        
-        comentario_limpo = emoji_pattern.sub('', comentario_texto)
+        comentario_limpo = limpar_comentario(comentario_texto)
         logger.info(f"Comentário após limpeza: {comentario_limpo}")
         
         # Constrói o prompt completo incluindo a análise
-        prompt_text = "\n".join(prompt_data['instructions'])
-        prompt_text += "\n\nAnálise do post:\n" + analise
-        prompt_text += "\n\n" + prompt_data['comment_template'].format(comment=comentario_limpo)
+        if analise is None:
+            contexto = prompt_data.get('single_pass_context', PROMPT_UNICO_CONTEXTO)
+            contexto = contexto.format(legenda=media_info.caption_text)
+        else:
+            contexto = "Análise do post:\n" + analise
+        prompt_text = prompt_config.montar(contexto, comentario_limpo)
         
         print("\n📝 Comentário que será enviado para o Llama:")
         print("=" * 50)
@@ -335,17 +632,19 @@ def gerar_resposta(comentario_texto: str, media_info) -> str:
         print(prompt_text)
         print("=" * 50)
         
-        texto = oci.generative_ai_inference.models.TextContent(
+        texto = models.TextContent(
             text=prompt_text
         )
         
-        imagem = oci.generative_ai_inference.models.ImageContent(
-            image_url=oci.generative_ai_inference.models.ImageUrl(url=base64_image_url)
-        )
+        conteudo = [texto]
+        if base64_image_url:
+            conteudo.append(models.ImageContent(
+                image_url=models.ImageUrl(url=base64_image_url)
+            ))
         
-        mensagem = oci.generative_ai_inference.models.UserMessage(
+        mensagem = models.UserMessage(
             role="USER",
-            content=[texto, imagem]
+            content=conteudo
         )
         logger.info("Mensagem criada com sucesso")
 
@@ -356,13 +655,14 @@ def gerar_resposta(comentario_texto: str, media_info) -> str:
         print(f"Temperature: 0.7")
         print(f"Top P: 0.5")
         print(f"Top K: 1")
+        print(f"Streaming: {STREAM_RESPONSES}")
         print("=" * 50)
 
-        chat_request = oci.generative_ai_inference.models.GenericChatRequest(
+        chat_request = models.GenericChatRequest(
             api_format="GENERIC",
             messages=[mensagem],
             num_generations=1,
-            is_stream=False,
+            is_stream=STREAM_RESPONSES,
             max_tokens=600,
             temperature=0.7,
             frequency_penalty=0,
@@ -372,9 +672,9 @@ def gerar_resposta(comentario_texto: str, media_info) -> str:
         )
         logger.info("Chat request configurado")
 
-        chat_detail = oci.generative_ai_inference.models.ChatDetails(
+        chat_detail = models.ChatDetails(
             compartment_id=os.getenv('OCI_COMPARTMENT_ID'),
-            serving_mode=oci.generative_ai_inference.models.OnDemandServingMode(
+            serving_mode=models.OnDemandServingMode(
                 model_id="meta.llama-3.2-90b-vision-instruct"
             ),
             chat_request=chat_request
@@ -404,14 +704,35 @@ def gerar_resposta(comentario_texto: str, media_info) -> str:
         print("=" * 50)
 
         logger.info("Fazendo chamada para a API...")
-        chat_response = oci_client.chat(chat_detail)
+        chat_response = enviar_chat(chat_detail)
         logger.info("Resposta recebida da API")
         
-        if chat_response and chat_response.data and chat_response.data.chat_response:
+        if STREAM_RESPONSES:
+            print("\n✍️ Resposta em geração:")
+            print("=" * 50)
+            # A geração acontece enquanto o stream é lido, depois que chat() já retornou
+            with metricas.span("Leitura do stream"):
+                response_text = ler_stream(chat_response)
+            print("=" * 50)
+            if response_text.strip():
+                registrar_pipeline(
+                    modo,
+                    time.time() - inicio,
+                    chat_contadores["requisicoes"] - requisicoes_inicio,
+                    chat_contadores["bytes"] - bytes_inicio
+                )
+                return response_text.strip()
+        elif chat_response and chat_response.data and chat_response.data.chat_response:
             choices = chat_response.data.chat_response.choices
             if choices and len(choices) > 0:
                 response_text = choices[0].message.content[0].text
                 logger.info(f"Resposta completa da Llama: {chat_response.data}")
+                registrar_pipeline(
+                    modo,
+                    time.time() - inicio,
+                    chat_contadores["requisicoes"] - requisicoes_inicio,
+                    chat_contadores["bytes"] - bytes_inicio
+                )
                 return response_text.strip()
         
         erro = "Resposta da API inválida ou vazia"
@@ -470,58 +791,60 @@ def escolher_comentario(comentarios: list) -> object:
 
 def processar_usuario(client, username: str):
     """Processa um usuário específico, obtendo seu último post e interagindo com ele."""
-    logger.info(f"Processando usuário: {username}")
+    with metricas.usuario(username), metricas.span("Processamento do usuário"):
+        logger.info(f"Processando usuário: {username}")
     
-    try:
-        media_info = obter_ultimo_post_foto(client, username)
-        if not media_info:
-            logger.info(f"Nenhum post de foto encontrado para {username}")
-            return
+        try:
+            media_info = obter_ultimo_post_foto(client, username)
+            if not media_info:
+                logger.info(f"Nenhum post de foto encontrado para {username}")
+                return
         
-        print(f"\n📝 Post de {username}:")
-        print("=" * 50)
-        print(media_info.caption_text)
-        print("=" * 50)
+            print(f"\n📝 Post de {username}:")
+            print("=" * 50)
+            print(media_info.caption_text)
+            print("=" * 50)
         
-        comentarios = obter_comentarios(client, media_info.pk)
+            comentarios = obter_comentarios(client, media_info.pk)
         
-        modo = escolher_modo_comentario()
+            modo = escolher_modo_comentario()
         
-        if modo == '1':
-            comentario_escolhido = escolher_comentario(comentarios)
-            if comentario_escolhido:
-                try:
-                    resposta = gerar_resposta(comentario_escolhido.text, media_info)
+            if modo == '1':
+                comentario_escolhido = escolher_comentario(comentarios)
+                if comentario_escolhido:
+                    try:
+                        resposta = gerar_resposta(comentario_escolhido.text, media_info)
                     
+                        if confirmar_resposta(resposta):
+                            resposta = resposta.replace('"', '').replace("'", "")
+                            result = responder_comentario(client, media_info.pk, comentario_escolhido.pk, resposta)
+                            print("\n✅ Resposta enviada com sucesso!")
+                            logger.info(f"Resposta publicada com ID: {result.pk}")
+                        else:
+                            print("\n❌ Resposta cancelada pelo usuário!")
+                    except Exception as e:
+                        logger.error(f"Erro ao publicar resposta: {e}")
+                        print("\n❌ Falha ao enviar resposta!")
+                else:
+                    print("\n❌ Nenhum comentário selecionado!")
+            else:
+                try:
+                    resposta = gerar_resposta(media_info.caption_text, media_info)
+                
                     if confirmar_resposta(resposta):
-                        resposta = resposta.replace('"', '').replace("'", "")
-                        result = responder_comentario(client, media_info.pk, comentario_escolhido.pk, resposta)
-                        print("\n✅ Resposta enviada com sucesso!")
-                        logger.info(f"Resposta publicada com ID: {result.pk}")
+                        result = comentar_post(client, media_info.pk, resposta)
+                        print("\n✅ Comentário enviado com sucesso!")
+                        logger.info(f"Comentário publicado com ID: {result.pk}")
                     else:
-                        print("\n❌ Resposta cancelada pelo usuário!")
+                        print("\n❌ Comentário cancelado pelo usuário!")
                 except Exception as e:
-                    logger.error(f"Erro ao publicar resposta: {e}")
-                    print("\n❌ Falha ao enviar resposta!")
-            else:
-                print("\n❌ Nenhum comentário selecionado!")
-        else:
-            try:
-                resposta = gerar_resposta(media_info.caption_text, media_info)
+                    logger.error(f"Erro ao publicar comentário: {e}")
+                    print("\n❌ Falha ao enviar comentário!")
                 
-                if confirmar_resposta(resposta):
-                    result = comentar_post(client, media_info.pk, resposta)
-                    print("\n✅ Comentário enviado com sucesso!")
-                    logger.info(f"Comentário publicado com ID: {result.pk}")
-                else:
-                    print("\n❌ Comentário cancelado pelo usuário!")
-            except Exception as e:
-                logger.error(f"Erro ao publicar comentário: {e}")
-                print("\n❌ Falha ao enviar comentário!")
-                
-    except Exception as e:
-        logger.error(f"Erro ao processar usuário {username}: {e}")
-        print(f"\n❌ Falha ao processar usuário {username}!")
+        except Exception as e:
+            logger.error(f"Erro ao processar usuário {username}: {e}")
+            print(f"\n❌ Falha ao processar usuário {username}!")
+
 
 def main():
     logger.info("=== INICIANDO O PROGRAMA ===")
@@ -541,6 +864,7 @@ def main():
         logger.info("Usando mocks para simulação")
         cl = MockInstagramClient()
     else:
+        from instagrapi import Client
         cl = Client()
         # Configuração do dispositivo
         cl.set_device({
@@ -564,6 +888,11 @@ def main():
         processar_usuario(cl, username)
         print("\n" + "="*50 + "\n")
     
+    logger.info(f"Cache de imagens: {image_cache.estatisticas()}")
+    logger.info(f"Cache de análises: {analise_cache.estatisticas()}")
+    relatorio_pipeline()
+    metricas.relatorio()
+    
     total_time = time.time() - total_start
     logger.info(f"=== PROGRAMA CONCLUÍDO EM {total_time:.2f} SEGUNDOS ===")
 
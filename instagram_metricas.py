@@ -0,0 +1,152 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger('instagram_bot')
+
+# Limites (em segundos) dos buckets do histograma, no estilo do Prometheus
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+PERCENTIS = (50, 90, 95, 99)
+
+USUARIO_PADRAO = "-"
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil `p` (0-100) com interpolação linear; `valores` precisa estar ordenado."""
+    if not valores:
+        return 0.0
+    posicao = (len(valores) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(valores) - 1)
+    return valores[inferior] + (valores[superior] - valores[inferior]) * (posicao - inferior)
+
+
+def _escapar_label(valor: str) -> str:
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """Registra a duração das etapas do bot como spans aninhados.
+
+    Cada span é identificado pelo usuário em processamento e pelo caminho das
+    etapas abertas (ex.: "Geração de resposta > Análise de imagem"). As durações
+    são agregadas em histogramas com percentis e podem ser exportadas em JSON ou
+    no formato texto do Prometheus.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._duracoes: Dict[Tuple[str, str], List[float]] = {}
+
+    def _pilha(self) -> List[str]:
+        if not hasattr(self._local, 'pilha'):
+            self._local.pilha = []
+        return self._local.pilha
+
+    @property
+    def usuario_atual(self) -> str:
+        return getattr(self._local, 'usuario', USUARIO_PADRAO)
+
+    @contextmanager
+    def usuario(self, username: str):
+        """Associa os spans abertos dentro do bloco ao usuário informado."""
+        anterior = self.usuario_atual
+        self._local.usuario = username
+        try:
+            yield
+        finally:
+            self._local.usuario = anterior
+
+    @contextmanager
+    def span(self, nome: str):
+        """Mede o bloco como uma etapa, aninhada nas etapas já abertas."""
+        pilha = self._pilha()
+        pilha.append(nome)
+        caminho = " > ".join(pilha)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(caminho, time.perf_counter() - inicio)
+            pilha.pop()
+
+    def registrar(self, etapa: str, duracao: float, usuario: Optional[str] = None):
+        chave = (usuario or self.usuario_atual, etapa)
+        with self._lock:
+            self._duracoes.setdefault(chave, []).append(duracao)
+
+    def limpar(self):
+        with self._lock:
+            self._duracoes.clear()
+
+    def resumo(self) -> List[dict]:
+        """Agrega as durações por usuário e etapa."""
+        with self._lock:
+            itens = [(chave, sorted(valores)) for chave, valores in self._duracoes.items()]
+
+        resumo = []
+        for (usuario, etapa), valores in itens:
+            buckets = {str(limite): sum(1 for v in valores if v <= limite) for limite in BUCKETS}
+            buckets["+Inf"] = len(valores)
+            resumo.append({
+                "usuario": usuario,
+                "etapa": etapa,
+                "contagem": len(valores),
+                "soma": sum(valores),
+                "min": valores[0],
+                "max": valores[-1],
+                "percentis": {f"p{p}": percentil(valores, p) for p in PERCENTIS},
+                "buckets": buckets,
+            })
+        return resumo
+
+    def exportar_json(self) -> str:
+        return json.dumps({"gerado_em": time.time(), "etapas": self.resumo()},
+                          ensure_ascii=False, indent=2)
+
+    def exportar_prometheus(self) -> str:
+        linhas = [
+            "# HELP unfluencer_etapa_segundos Duração das etapas do Unfluencer em segundos.",
+            "# TYPE unfluencer_etapa_segundos histogram",
+        ]
+        percentis = [
+            "# HELP unfluencer_etapa_percentil_segundos Percentis da duração das etapas em segundos.",
+            "# TYPE unfluencer_etapa_percentil_segundos gauge",
+        ]
+        for item in self.resumo():
+            labels = f'usuario="{_escapar_label(item["usuario"])}",etapa="{_escapar_label(item["etapa"])}"'
+            for limite, contagem in item["buckets"].items():
+                linhas.append(f'unfluencer_etapa_segundos_bucket{{{labels},le="{limite}"}} {contagem}')
+            linhas.append(f'unfluencer_etapa_segundos_sum{{{labels}}} {item["soma"]:.6f}')
+            linhas.append(f'unfluencer_etapa_segundos_count{{{labels}}} {item["contagem"]}')
+            for nome, valor in item["percentis"].items():
+                quantil = int(nome[1:]) / 100
+                percentis.append(
+                    f'unfluencer_etapa_percentil_segundos{{{labels},quantile="{quantil}"}} {valor:.6f}'
+                )
+        return "\n".join(linhas + percentis) + "\n"
+
+    def exportar(self, caminho: str, formato: Optional[str] = None):
+        """Grava as métricas em `caminho`; o formato é deduzido da extensão se não for informado."""
+        if formato is None:
+            formato = 'prometheus' if caminho.endswith(('.prom', '.txt')) else 'json'
+        conteudo = self.exportar_prometheus() if formato == 'prometheus' else self.exportar_json()
+        try:
+            with open(caminho, 'w', encoding='utf-8') as f:
+                f.write(conteudo)
+            logger.info(f"Métricas exportadas para {caminho} ({formato})")
+        except OSError as e:
+            logger.error(f"Não foi possível exportar métricas: {e}")
+
+    def relatorio(self):
+        """Loga uma linha por usuário e etapa com contagem e percentis."""
+        for item in self.resumo():
+            p = item["percentis"]
+            logger.info(
+                f"[{item['usuario']}] {item['etapa']}: n={item['contagem']} "
+                f"p50={p['p50']:.2f}s p90={p['p90']:.2f}s p99={p['p99']:.2f}s max={item['max']:.2f}s"
+            )
@@ -1,6 +1,9 @@
 from dataclasses import dataclass
-from typing import List, Optional
+from types import SimpleNamespace
+from typing import Iterator, List, Optional, Tuple
 from datetime import datetime
+import json
+import time
 
 @dataclass
 class MockUser:
@@ -33,6 +36,7 @@ class MockMedia:
     comment_count: int
     taken_at: datetime
     user: MockUser
+    media_type: int = 8
 
     def __getattr__(self, name):
         """Método para lidar com atributos dinâmicos"""
@@ -42,6 +46,38 @@ class MockMedia:
             return self.thumbnail_url
         raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
 
+@dataclass
+class MockTextContent:
+    text: str
+    type: str = "TEXT"
+
+@dataclass
+class MockChatMessage:
+    content: List[MockTextContent]
+    role: str = "ASSISTANT"
+
+@dataclass
+class MockChatChoice:
+    message: MockChatMessage
+    index: int = 0
+    finish_reason: str = "stop"
+
+@dataclass
+class MockChatResult:
+    choices: List[MockChatChoice]
+
+@dataclass
+class MockChatResponseData:
+    chat_response: MockChatResult
+
+@dataclass
+class MockChatResponse:
+    data: object
+
+@dataclass
+class MockStreamEvent:
+    data: str
+
 # Mock de usuário
 MOCK_USER = MockUser(
     pk=123456789,
@@ -94,11 +130,28 @@ MOCK_MEDIA = MockMedia(
 )
 
 class MockInstagramClient:
-    def __init__(self, use_mocks=True):
+    def __init__(self, use_mocks=True, media: Optional[MockMedia] = None):
         self.use_mocks = use_mocks
-        self.media_id = MOCK_MEDIA.pk
+        self._media_info = media or MOCK_MEDIA
+        self.media_id = self._media_info.pk
         self.comments = MOCK_COMMENTS
-        self._media_info = MOCK_MEDIA
+
+    def user_id_from_username(self, username: str) -> int:
+        if self.use_mocks:
+            return self._media_info.user.pk
+        raise NotImplementedError("Método não mockado")
+
+    def user_medias(self, user_id: int, amount: int = 20) -> List[MockMedia]:
+        if self.use_mocks:
+            return [self._media_info][:amount]
+        raise NotImplementedError("Método não mockado")
+
+    def user_medias_paginated(self, user_id: int, amount: int = 0, end_cursor: str = "") -> Tuple[List[MockMedia], str]:
+        if self.use_mocks:
+            if end_cursor:
+                return [], ""
+            return [self._media_info], ""
+        raise NotImplementedError("Método não mockado")
 
     def media_pk_from_url(self, url: str) -> int:
         if self.use_mocks:
@@ -144,4 +197,68 @@ class MockInstagramClient:
     def dump_settings(self, session_file: str):
         if self.use_mocks:
             return True
-        raise NotImplementedError("Método não mockado") 
\ No newline at end of file
+        raise NotImplementedError("Método não mockado") 
+
+class MockRequestModel:
+    """Modelo de requisição simulado: guarda os argumentos recebidos como atributos."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+# Substitutos de oci.generative_ai_inference.models, para usar o MockInferenceClient sem o SDK
+mock_models = SimpleNamespace(**{
+    nome: type(nome, (MockRequestModel,), {})
+    for nome in ("TextContent", "ImageContent", "ImageUrl", "UserMessage",
+                 "GenericChatRequest", "ChatDetails", "OnDemandServingMode")
+})
+
+# Textos devolvidos pelo cliente de inferência simulado
+MOCK_ANALISE = "A imagem mostra batatas sobre uma mesa. A legenda é descontraída e o tom do post é informativo."
+MOCK_RESPOSTA = "Tá, mas por quê?"
+
+class MockChatStream:
+    """Simula o stream SSE do OCI, entregando a resposta em pedaços com `events()`."""
+
+    def __init__(self, texto: str, intervalo: float = 0.05, tamanho_pedaco: int = 4):
+        self.texto = texto
+        self.intervalo = intervalo
+        self.tamanho_pedaco = tamanho_pedaco
+
+    def events(self) -> Iterator[MockStreamEvent]:
+        for i in range(0, len(self.texto), self.tamanho_pedaco):
+            time.sleep(self.intervalo)
+            pedaco = self.texto[i:i + self.tamanho_pedaco]
+            yield MockStreamEvent(data=json.dumps({
+                "index": 0,
+                "message": {"role": "ASSISTANT", "content": [{"type": "TEXT", "text": pedaco}]}
+            }))
+        yield MockStreamEvent(data=json.dumps({"index": 0, "finishReason": "stop"}))
+
+class MockInferenceClient:
+    """Substituto local do GenerativeAiInferenceClient, sem credenciais nem rede."""
+
+    def __init__(self, intervalo_stream: float = 0.05, latencia: float = 0.0):
+        self.intervalo_stream = intervalo_stream
+        self.latencia = latencia
+
+    def _gerar_texto(self, chat_request) -> str:
+        for msg in chat_request.messages:
+            for content in msg.content:
+                if (getattr(content, 'text', None) or '').startswith("Analise esta imagem"):
+                    return MOCK_ANALISE
+        return MOCK_RESPOSTA
+
+    def chat(self, chat_detail) -> MockChatResponse:
+        chat_request = chat_detail.chat_request
+        texto = self._gerar_texto(chat_request)
+        if self.latencia:
+            time.sleep(self.latencia)
+
+        if chat_request.is_stream:
+            return MockChatResponse(data=MockChatStream(texto, self.intervalo_stream))
+
+        return MockChatResponse(data=MockChatResponseData(
+            chat_response=MockChatResult(choices=[
+                MockChatChoice(message=MockChatMessage(content=[MockTextContent(text=texto)]))
+            ])
+        ))